@@ -0,0 +1,331 @@
+"""Micro-benchmarks for every MongoHelper operation, apart from the delete_all_* testing helpers
+
+Runs each operation against synthetic repos of several sizes and records the wall time and number of
+round trips per call. Run from the repo root:
+
+    python -m benchmarks.bench_mongo_helper --scales small,medium --save-baseline baseline.json
+    python -m benchmarks.bench_mongo_helper --scales small,medium --baseline baseline.json
+
+Without --uri the in memory engine from mongo_memory is used, with --uri the benchmarks run against that
+server (e.g. mongodb://localhost:27017) in a throwaway database.
+"""
+
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+
+import pymongo
+
+from benchmarks.synthetic import SCALES, commit_sha, file_path, make_file
+from mongo_helper import REPO_COL, MongoHelper
+from mongo_memory import MemoryDatabase
+from mongo_profiler import profile_queries
+
+OWNER = "bench"
+REPO = "bench-repo"
+BRANCH = "main"
+
+
+class Bench:
+    def __init__(self, db, scale: dict, samples: int):
+        self.helper = MongoHelper(db=db)
+        self.scale = scale
+        self.samples = min(samples, scale["files"])
+        self.results = dict()
+
+    # Times fn(i) for i in range(samples) and records the median time and mean round trips per call
+    def measure(self, name: str, fn, samples: int = None) -> None:
+        times = []
+        trips = []
+        for i in range(samples or self.samples):
+            with profile_queries(self.helper) as profile:
+                start = time.perf_counter()
+                fn(i)
+                times.append((time.perf_counter() - start) * 1000)
+            trips.append(profile.round_trips)
+        self.results[name] = dict(
+            [
+                ("ms", statistics.median(times)),
+                (
+                    "p95_ms",
+                    sorted(times)[int(len(times) * 0.95) - 1 if len(times) > 1 else 0],
+                ),
+                ("round_trips", statistics.mean(trips)),
+            ]
+        )
+
+    def file(self, i: int, commits: int = 1) -> dict:
+        return make_file(
+            i, self.scale["functions"], self.scale["history"], commits=commits
+        )
+
+    def run(self) -> dict:
+        h = self.helper
+        files = self.scale["files"]
+        h.create_indexes()
+
+        self.measure("write_repo", lambda i: h.write_repo(OWNER, f"{REPO}-{i}", BRANCH))
+        self.measure(
+            "delete_repo_empty", lambda i: h.delete_repo(OWNER, f"{REPO}-{i}", BRANCH)
+        )
+        h.write_repo(OWNER, REPO, BRANCH)
+
+        # the first samples are timed, the rest of the repo is filled in untimed
+        self.measure(
+            "write_file_insert",
+            lambda i: h.write_file(self.file(i), OWNER, REPO, BRANCH),
+        )
+        for i in range(self.samples, files):
+            h.write_file(self.file(i), OWNER, REPO, BRANCH)
+        # the indexes already exist, so this times the index checks and function backfill on a full repo
+        self.measure("create_indexes", lambda i: h.create_indexes(), 3)
+
+        path = file_path
+        self.measure("get_repo", lambda i: h.get_repo(OWNER, REPO, BRANCH))
+        self.measure("get_repo_id", lambda i: h.get_repo_id(OWNER, REPO, BRANCH))
+        self.measure("get_file", lambda i: h.get_file(OWNER, REPO, BRANCH, path(i)))
+        self.measure(
+            "get_file_raw", lambda i: h.get_file(OWNER, REPO, BRANCH, path(i), raw=True)
+        )
+        self.measure(
+            "get_file_bytes", lambda i: h.get_file_bytes(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "get_file_not_modified",
+            lambda i: h.get_file(
+                OWNER, REPO, BRANCH, path(i), known_commit=commit_sha(f"{i}-1")
+            ),
+        )
+        self.measure(
+            "get_file_id", lambda i: h.get_file_id(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "get_line_history",
+            lambda i: h.get_line_history(OWNER, REPO, BRANCH, path(i), since=0),
+        )
+        self.measure(
+            "get_all_repo_files", lambda i: h.get_all_repo_files(OWNER, REPO, BRANCH), 3
+        )
+        self.measure(
+            "get_all_repo_files_page",
+            lambda i: h.get_all_repo_files(OWNER, REPO, BRANCH, page_size=50),
+        )
+        batch = [path(i) for i in range(self.samples)]
+        self.measure(
+            "get_files_many", lambda i: h.get_files_many(OWNER, REPO, BRANCH, batch), 3
+        )
+        self.measure(
+            "get_functions", lambda i: h.get_functions(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "get_functions_not_modified",
+            lambda i: h.get_functions(
+                OWNER, REPO, BRANCH, path(i), known_commit=commit_sha(f"{i}-1")
+            ),
+        )
+        self.measure(
+            "get_functions_many",
+            lambda i: h.get_functions_many(OWNER, REPO, BRANCH, batch),
+            3,
+        )
+        self.measure(
+            "get_function",
+            lambda i: h.get_function(OWNER, REPO, BRANCH, path(i), f"func_{i}_0"),
+        )
+        self.measure(
+            "search_functions_exact",
+            lambda i: h.search_functions(
+                OWNER, REPO, BRANCH, f"func_{i}_0", match="exact"
+            ),
+        )
+        self.measure(
+            "search_functions_prefix",
+            lambda i: h.search_functions(
+                OWNER, REPO, BRANCH, f"func_{i}_", match="prefix"
+            ),
+        )
+        self.measure(
+            "search_functions_text",
+            lambda i: h.search_functions(
+                OWNER, REPO, BRANCH, f"func_{i}_0", match="text"
+            ),
+        )
+        self.measure(
+            "get_lock_status", lambda i: h.get_lock_status(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "update_lock", lambda i: h.update_lock(OWNER, REPO, BRANCH, path(i), True)
+        )
+        self.measure(
+            "update_user_score",
+            lambda i: h.update_user_score(
+                OWNER, REPO, BRANCH, path(i), f"func_{i}_0", 1
+            ),
+        )
+        self.measure(
+            "write_file_update",
+            lambda i: h.write_file(self.file(i, commits=2), OWNER, REPO, BRANCH),
+        )
+        self.measure(
+            "write_file_unchanged",
+            lambda i: h.write_file(self.file(i, commits=2), OWNER, REPO, BRANCH),
+        )
+        self.measure(
+            "update_file",
+            lambda i: h.update_file(
+                dict([("path", path(i))]), dict([("reviewed", True)])
+            ),
+        )
+        self.measure(
+            "delete_functions",
+            lambda i: h.delete_functions(OWNER, REPO, BRANCH, path(i)),
+        )
+        self.measure(
+            "write_functions",
+            lambda i: h.write_functions(
+                self.file(i, commits=2), OWNER, REPO, BRANCH, path(i)
+            ),
+        )
+
+        self.measure("repo_record", lambda i: h.repo_record(OWNER, REPO, BRANCH))
+        self.measure(
+            "file_record", lambda i: h.file_record(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "file_records",
+            lambda i: h.file_records(OWNER, REPO, BRANCH, history=False),
+            3,
+        )
+        self.measure(
+            "function_table", lambda i: h.function_table(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure(
+            "function_record",
+            lambda i: h.function_record(OWNER, REPO, BRANCH, path(i), f"func_{i}_0"),
+        )
+
+        self.measure(
+            "create_user",
+            lambda i: h.create_user(
+                "first", "last", f"user{i}", "password", "a@b.c", []
+            ),
+        )
+        self.measure("get_user", lambda i: h.get_user(f"user{i}"))
+        self.measure("user_record", lambda i: h.user_record(f"user{i}"))
+        self.measure(
+            "update_user",
+            lambda i: h.update_user(f"user{i}", dict([("email", f"user{i}@b.c")])),
+        )
+        self.measure(
+            "verify_user_login", lambda i: h.verify_user_login("password", f"user{i}")
+        )
+        self.measure("write_cookie", lambda i: h.write_cookie(f"user{i}", f"cookie{i}"))
+        self.measure("get_cookie", lambda i: h.get_cookie(f"user{i}"))
+        self.measure("delete_cookie", lambda i: h.delete_cookie(f"user{i}"))
+        self.measure("delete_user", lambda i: h.delete_user(f"user{i}"))
+
+        self.measure(
+            "archive_branch", lambda i: h.archive_branch(OWNER, REPO, BRANCH), 1
+        )
+        self.measure(
+            "restore_branch", lambda i: h.restore_branch(OWNER, REPO, BRANCH), 1
+        )
+        # backdated so the sweep has a branch to archive
+        h.db[REPO_COL].update_one(
+            dict([("owner", OWNER), ("repo", REPO), ("branch", BRANCH)]),
+            {"$set": dict([("last_write", datetime.datetime(2020, 1, 1))])},
+        )
+        self.measure(
+            "archive_stale_branches", lambda i: h.archive_stale_branches(days=30), 1
+        )
+        h.restore_branch(OWNER, REPO, BRANCH)
+        self.measure(
+            "delete_file", lambda i: h.delete_file(OWNER, REPO, BRANCH, path(i))
+        )
+        self.measure("delete_repo", lambda i: h.delete_repo(OWNER, REPO, BRANCH), 1)
+        return self.results
+
+
+# Returns the operations that got slower than the tolerance allows or now need more round trips
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for scale, ops in results.items():
+        for op, now in ops.items():
+            then = baseline.get(scale, {}).get(op)
+            if then is None:
+                continue
+            if now["round_trips"] > then["round_trips"]:
+                regressions.append(
+                    f"{scale}/{op}: round trips {then['round_trips']:.1f} -> {now['round_trips']:.1f}"
+                )
+            if now["ms"] > then["ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{scale}/{op}: {then['ms']:.3f}ms -> {now['ms']:.3f}ms"
+                )
+    return regressions
+
+
+def _database(uri: str, name: str):
+    if uri is None:
+        return MemoryDatabase(name)
+    client = pymongo.MongoClient(uri)
+    client.drop_database(name)
+    return client[name]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--uri", help="mongodb uri, the in memory engine is used if omitted"
+    )
+    parser.add_argument(
+        "--db", default="shdb_bench", help="database to run in, it is dropped first"
+    )
+    parser.add_argument(
+        "--scales", default="small,medium", help=f"comma list of {', '.join(SCALES)}"
+    )
+    parser.add_argument(
+        "--samples", type=int, default=20, help="timed calls per operation"
+    )
+    parser.add_argument(
+        "--baseline", help="json file of a previous run to compare against"
+    )
+    parser.add_argument("--save-baseline", help="write the results to this json file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown over the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    results = dict()
+    for scale in args.scales.split(","):
+        bench = Bench(_database(args.uri, args.db), SCALES[scale], args.samples)
+        results[scale] = bench.run()
+        print(f"{scale} {SCALES[scale]}")
+        for op, stats in results[scale].items():
+            print(
+                f"  {op:<28} {stats['ms']:>9.3f}ms  p95 {stats['p95_ms']:>9.3f}ms  "
+                f"{stats['round_trips']:>6.1f} round trips"
+            )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as base:
+            regressions = compare(results, json.load(base), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
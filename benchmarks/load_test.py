@@ -0,0 +1,313 @@
+"""Concurrent load test for MongoHelper
+
+Runs a mix of analyzer and reader workloads against one repo from many workers at once. Analyzers take the file
+lock, write_file a new analysis and release the lock; readers call get_functions and users log in with
+verify_user_login. Reports throughput, p50/p95/p99 latency per method, lock conflicts and any duplicate or orphaned
+documents left behind. Run from the repo root:
+
+    python -m benchmarks.load_test --workers 16 --ops 5000 --mix analyze=20,get_functions=60,login=20
+    python -m benchmarks.load_test --mode asyncio --skew 1.2 --uri mongodb://localhost:27017
+
+Without --uri the in memory engine from mongo_memory is used.
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+
+from benchmarks.synthetic import SCALES, file_path, make_file
+from mongo_helper import FILE_COL, FUNC_COL, REPO_COL, USER_COL, MongoHelper
+from mongo_memory import MemoryDatabase
+
+OWNER = "load"
+REPO = "load-repo"
+BRANCH = "main"
+PASSWORD = "password"
+
+# Workload methods that can be named in --mix
+OPERATIONS = ("analyze", "get_functions", "get_file", "login")
+
+
+class Stats:
+    """Latencies, errors and anomaly counters shared by every worker"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock_conflicts = 0
+        self.lock_races = 0
+
+    def record(self, method: str, seconds: float, failed: bool) -> None:
+        with self.lock:
+            self.latencies[method].append(seconds * 1000)
+            if failed:
+                self.errors[method] += 1
+
+
+# Draws keys in [0, n) with a zipf like skew, 0 is uniform and larger values concentrate on the first keys
+class KeyPicker:
+    def __init__(self, n: int, skew: float):
+        weights = [1 / (k + 1) ** skew for k in range(n)]
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.keys = list(range(n))
+
+    def pick(self, rng: random.Random) -> int:
+        return rng.choices(self.keys, cum_weights=self.cum_weights)[0]
+
+
+# Returns the random source of one worker. With a seed every worker draws the same operations and keys on every
+# run, without one each run is different
+def worker_rng(seed: int, worker) -> random.Random:
+    return random.Random(None if seed is None else f"{seed}-{worker}")
+
+
+# Every operation takes the random source of the worker running it
+class Workload:
+    def __init__(self, helper: MongoHelper, scale: dict, skew: float):
+        self.helper = helper
+        self.scale = scale
+        self.stats = Stats()
+        self.files = KeyPicker(scale["files"], skew)
+        self.users = KeyPicker(scale["users"], skew)
+        # next commit count per file so every analysis is newer than the one stored
+        self.commits = [itertools.count(2) for _ in range(scale["files"])]
+        self.commits_lock = threading.Lock()
+        # which worker believes it holds each file lock, to catch two analyzers holding it at once
+        self.holders = dict()
+        self.holders_lock = threading.Lock()
+
+    def seed_data(self) -> None:
+        h = self.helper
+        h.create_indexes()
+        h.write_repo(OWNER, REPO, BRANCH)
+        for i in range(self.scale["files"]):
+            h.write_file(self._file(i, 1), OWNER, REPO, BRANCH)
+        for i in range(self.scale["users"]):
+            h.create_user("first", "last", f"user{i}", PASSWORD, "a@b.c", [])
+
+    def _file(self, i: int, commits: int) -> dict:
+        return make_file(
+            i, self.scale["functions"], self.scale["history"], commits=commits
+        )
+
+    def _call(self, method: str, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = getattr(self.helper, method)(*args, **kwargs)
+            failed = isinstance(result, dict) and result.get("status") == "Failed"
+            return result
+        except Exception:
+            return None
+        finally:
+            self.stats.record(method, time.perf_counter() - start, failed)
+
+    def analyze(self, rng: random.Random) -> None:
+        i = self.files.pick(rng)
+        path = file_path(i)
+        status = self._call("get_lock_status", OWNER, REPO, BRANCH, path)
+        if status is None or status.get("lock_status") is not False:
+            with self.stats.lock:
+                self.stats.lock_conflicts += 1
+            return
+
+        self._call("update_lock", OWNER, REPO, BRANCH, path, True)
+        me = threading.get_ident()
+        with self.holders_lock:
+            if path in self.holders:
+                # the lock is check then set, so two analyzers can both see it free
+                with self.stats.lock:
+                    self.stats.lock_races += 1
+            self.holders[path] = me
+        try:
+            with self.commits_lock:
+                commits = next(self.commits[i])
+            self._call("write_file", self._file(i, commits), OWNER, REPO, BRANCH)
+        finally:
+            with self.holders_lock:
+                if self.holders.get(path) == me:
+                    del self.holders[path]
+            self._call("update_lock", OWNER, REPO, BRANCH, path, False)
+
+    def get_functions(self, rng: random.Random) -> None:
+        path = file_path(self.files.pick(rng))
+        self._call("get_functions", OWNER, REPO, BRANCH, path)
+
+    def get_file(self, rng: random.Random) -> None:
+        self._call("get_file", OWNER, REPO, BRANCH, file_path(self.files.pick(rng)))
+
+    def login(self, rng: random.Random) -> None:
+        self._call("verify_user_login", PASSWORD, f"user{self.users.pick(rng)}")
+
+    # Counts documents that should be unique but are not, and functions whose file is gone
+    def anomalies(self) -> dict:
+        db = self.helper.db
+        found = dict()
+        for name, col, keys in (
+            ("duplicate repos", REPO_COL, ("owner", "repo", "branch")),
+            ("duplicate files", FILE_COL, ("repo_id", "path")),
+            ("duplicate functions", FUNC_COL, ("file_id", "name")),
+            ("duplicate users", USER_COL, ("user_name",)),
+        ):
+            seen = defaultdict(int)
+            for doc in db[col].find({}, dict([(k, 1) for k in keys])):
+                seen[tuple(doc.get(k) for k in keys)] += 1
+            found[name] = sum(n - 1 for n in seen.values() if n > 1)
+
+        file_ids = set(doc["_id"] for doc in db[FILE_COL].find({}, {"_id": 1}))
+        found["orphaned functions"] = sum(
+            1
+            for doc in db[FUNC_COL].find({}, {"file_id": 1})
+            if doc["file_id"] not in file_ids
+        )
+        return found
+
+
+def _parse_mix(mix: str) -> tuple:
+    ops = []
+    weights = []
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"unknown operation {name}, expected one of {OPERATIONS}")
+        ops.append(name.strip())
+        weights.append(float(weight))
+    return ops, list(itertools.accumulate(weights))
+
+
+def run_threads(
+    workload: Workload,
+    ops: list,
+    cum_weights: list,
+    workers: int,
+    total: int,
+    seed: int = None,
+):
+    def worker(index: int, count: int) -> None:
+        rng = worker_rng(seed, index)
+        for _ in range(count):
+            getattr(workload, rng.choices(ops, cum_weights=cum_weights)[0])(rng)
+
+    per_worker = [
+        total // workers + (1 if w < total % workers else 0) for w in range(workers)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(worker, range(workers), per_worker))
+
+
+# pymongo is blocking, so in asyncio mode every call runs on the loop's executor like an async web handler would.
+# Calls are handed to whichever executor thread is free, so each call gets its own random source drawn from the
+# loop's, which keeps the operations and keys of a seeded run the same
+def run_asyncio(
+    workload: Workload,
+    ops: list,
+    cum_weights: list,
+    workers: int,
+    total: int,
+    seed: int = None,
+):
+    async def main() -> None:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+        rng = worker_rng(seed, "loop")
+        pending = set()
+        for _ in range(total):
+            op = getattr(workload, rng.choices(ops, cum_weights=cum_weights)[0])
+            op_rng = random.Random(rng.getrandbits(64))
+            pending.add(loop.run_in_executor(None, op, op_rng))
+            if len(pending) >= workers:
+                _, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        await asyncio.gather(*pending)
+
+    asyncio.run(main())
+
+
+def _percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(workload: Workload, seconds: float, total: int) -> None:
+    stats = workload.stats
+    print(f"{total} operations in {seconds:.2f}s, {total / seconds:.0f} ops/s")
+    print(
+        f"  {'method':<20} {'calls':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    )
+    for method, times in sorted(stats.latencies.items()):
+        print(
+            f"  {method:<20} {len(times):>7} {_percentile(times, 50):>9.3f} "
+            f"{_percentile(times, 95):>9.3f} {_percentile(times, 99):>9.3f} "
+            f"{stats.errors[method]:>7}"
+        )
+    print(f"  lock conflicts: {stats.lock_conflicts}")
+    print(f"  lock races: {stats.lock_races}")
+    for name, count in workload.anomalies().items():
+        print(f"  {name}: {count}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--uri", help="mongodb uri, the in memory engine is used if omitted"
+    )
+    parser.add_argument(
+        "--db", default="shdb_load", help="database to run in, it is dropped first"
+    )
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=2000, help="total operations to run")
+    parser.add_argument(
+        "--mix",
+        default="analyze=20,get_functions=50,get_file=10,login=20",
+        help=f"weighted operations out of {', '.join(OPERATIONS)}",
+    )
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=1.0,
+        help="zipf exponent for key choice, 0 is uniform",
+    )
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed for the operations and keys each worker draws, random if omitted",
+    )
+    args = parser.parse_args(argv)
+
+    if args.uri is None:
+        db = MemoryDatabase(args.db)
+    else:
+        client = pymongo.MongoClient(args.uri)
+        client.drop_database(args.db)
+        db = client[args.db]
+
+    scale = dict(SCALES[args.scale])
+    scale["users"] = args.users
+    workload = Workload(MongoHelper(db=db), scale, args.skew)
+    workload.seed_data()
+
+    ops, cum_weights = _parse_mix(args.mix)
+    start = time.perf_counter()
+    if args.mode == "thread":
+        run_threads(workload, ops, cum_weights, args.workers, args.ops, args.seed)
+    else:
+        run_asyncio(workload, ops, cum_weights, args.workers, args.ops, args.seed)
+    report(workload, time.perf_counter() - start, args.ops)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
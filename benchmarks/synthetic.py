@@ -0,0 +1,65 @@
+import hashlib
+import random
+
+# sizes of the synthetic repos the benchmarks and load tests generate
+SCALES = {
+    "small": dict([("files", 20), ("functions", 5), ("history", 10)]),
+    "medium": dict([("files", 200), ("functions", 20), ("history", 100)]),
+    "large": dict([("files", 2000), ("functions", 50), ("history", 1000)]),
+}
+
+
+# Returns a fake commit sha that is stable for the same seed
+def commit_sha(seed) -> str:
+    return hashlib.sha1(str(seed).encode("utf-8")).hexdigest()
+
+
+def file_path(index: int) -> str:
+    return f"src/pkg{index % 50}/module_{index}.py"
+
+
+# Builds the file_data dict analyze passes to write_file
+def make_file(
+    index: int, functions: int, history: int, commits: int = 1, rng=None
+) -> dict:
+    rng = rng or random.Random(index)
+    line_history = []
+    for n in range(history):
+        line_history.append(
+            dict(
+                [
+                    ("commit", commit_sha(f"{index}-{n % commits}")),
+                    ("author", f"dev{rng.randrange(20)}"),
+                    ("line", n + 1),
+                    ("change", rng.choice(["added", "modified", "deleted"])),
+                ]
+            )
+        )
+
+    funcs = []
+    for n in range(functions):
+        start = n * 20 + 1
+        funcs.append(
+            dict(
+                [
+                    ("name", f"func_{index}_{n}"),
+                    ("start_line", start),
+                    ("end_line", start + rng.randrange(5, 19)),
+                    ("complexity", rng.randrange(1, 30)),
+                    (
+                        "doc",
+                        f"handles {rng.choice(['parsing', 'io', 'auth', 'render'])}",
+                    ),
+                ]
+            )
+        )
+
+    return dict(
+        [
+            ("path", file_path(index)),
+            ("last_commit", commit_sha(f"{index}-{commits}")),
+            ("commits", commits),
+            ("line_history", line_history),
+            ("functions", funcs),
+        ]
+    )
@@ -0,0 +1,886 @@
+import copy
+import re
+import threading
+
+import bson
+import pymongo
+from bson import ObjectId
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from pymongo.errors import (
+    BulkWriteError,
+    CollectionInvalid,
+    DuplicateKeyError,
+    InvalidOperation,
+)
+from pymongo.results import (
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+from mongo_helper import COOKIE_COL, FILE_COL, FUNC_COL, REPO_COL, USER_COL
+
+# The storage backend MongoHelper talks to is anything that looks like a pymongo Database: db[name] returns a
+# collection with find, find_one, insert_one, insert_many, update, update_one, replace_one, delete_one, delete_many,
+# distinct, create_index and with_options, and the db itself has client, list_collection_names and
+# create_collection. MemoryDatabase implements that subset in process so the helper can run without a server.
+
+# hash indexes every in memory database starts with, matching the keys the helper looks documents up by
+DEFAULT_INDEXES = {
+    REPO_COL: [("owner", "repo", "branch")],
+    FILE_COL: [("repo_id", "path"), ("repo_id",)],
+    FUNC_COL: [("file_id", "name"), ("file_id",)],
+    USER_COL: [("user_name",)],
+    COOKIE_COL: [("user_name",)],
+}
+
+# used in place of a value for fields a document does not have
+_MISSING = object()
+
+
+# Returns the value at a dotted path in a document or _MISSING
+def _get(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+# Sets the value at a dotted path in a document, creating embedded documents on the way
+def _set(doc: dict, path: str, value) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+# Orders values the way the server does: by BSON type first and then by value
+def _type_rank(value) -> int:
+    if value is _MISSING or value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float, bson.Int64, bson.Decimal128)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if hasattr(value, "utcoffset"):
+        return 9
+    return 10
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (4, 5):
+        return (rank, repr(value))
+    if isinstance(value, bson.Decimal128):
+        return (rank, value.to_decimal())
+    return (rank, value)
+
+
+def _compare(value, cond, op) -> bool:
+    # comparison operators only match values of the same type bracket
+    if _type_rank(value) != _type_rank(cond) or value is _MISSING:
+        return False
+    try:
+        return op(_sort_key(value), _sort_key(cond))
+    except TypeError:
+        return False
+
+
+def _equals(value, cond) -> bool:
+    if value is _MISSING:
+        return cond is None
+    if _type_rank(value) != _type_rank(cond):
+        # a scalar condition also matches any element of an array field
+        return isinstance(value, list) and any(_equals(v, cond) for v in value)
+    if value == cond:
+        return True
+    return isinstance(value, list) and any(_equals(v, cond) for v in value)
+
+
+def _regex(value, pattern, options: str = "") -> bool:
+    if isinstance(value, list):
+        return any(_regex(v, pattern, options) for v in value)
+    if not isinstance(value, str):
+        return False
+    flags = 0
+    for opt, flag in (("i", re.I), ("m", re.M), ("s", re.S), ("x", re.X)):
+        if opt in options:
+            flags |= flag
+    if not isinstance(pattern, str):
+        flags |= pattern.flags
+        pattern = pattern.pattern
+    return re.search(pattern, value, flags) is not None
+
+
+def _match_ops(value, ops: dict) -> bool:
+    for op, cond in ops.items():
+        if op == "$eq":
+            ok = _equals(value, cond)
+        elif op == "$ne":
+            ok = not _equals(value, cond)
+        elif op == "$in":
+            ok = _in(value, cond)
+        elif op == "$nin":
+            ok = not _in(value, cond)
+        elif op == "$gt":
+            ok = _compare(value, cond, lambda a, b: a > b)
+        elif op == "$gte":
+            ok = _compare(value, cond, lambda a, b: a >= b)
+        elif op == "$lt":
+            ok = _compare(value, cond, lambda a, b: a < b)
+        elif op == "$lte":
+            ok = _compare(value, cond, lambda a, b: a <= b)
+        elif op == "$exists":
+            ok = (value is not _MISSING) == bool(cond)
+        elif op == "$regex":
+            ok = _regex(value, cond, ops.get("$options", ""))
+        elif op == "$options":
+            ok = True
+        elif op == "$size":
+            ok = isinstance(value, list) and len(value) == cond
+        elif op == "$not":
+            ok = not _match_ops(value, cond)
+        else:
+            raise NotImplementedError(f"query operator {op} is not supported")
+        if not ok:
+            return False
+    return True
+
+
+class _InSet(list):
+    """$in values with a hashed copy so membership of scalar values is a set lookup"""
+
+    def __init__(self, values):
+        super().__init__(values)
+        self.keys = set((_type_rank(v), v) for v in self if _hashable(v))
+        self.unhashed = [v for v in self if not _hashable(v)]
+
+
+def _in(value, cond) -> bool:
+    if isinstance(cond, _InSet) and _hashable(value) and value is not _MISSING:
+        return (_type_rank(value), value) in cond.keys or any(
+            _equals(value, c) for c in cond.unhashed
+        )
+    return any(_equals(value, c) for c in cond)
+
+
+# Swaps $in lists for _InSets once per query instead of comparing against every value for every document
+def _prepare(query: dict) -> dict:
+    prepared = dict()
+    for key, cond in query.items():
+        if key in ("$or", "$and", "$nor"):
+            cond = [_prepare(q) for q in cond]
+        elif _is_ops(cond):
+            cond = dict(cond)
+            for op in ("$in", "$nin"):
+                if op in cond and not isinstance(cond[op], _InSet):
+                    cond[op] = _InSet(cond[op])
+        prepared[key] = cond
+    return prepared
+
+
+def _is_ops(cond) -> bool:
+    return isinstance(cond, dict) and len(cond) > 0 and next(iter(cond)).startswith("$")
+
+
+# Yields every string in a document, used by $text
+def _strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+# Scores a document against a $text search. Terms are matched as whole words without stemming
+def _text_score(doc: dict, search: str) -> float:
+    terms = [t.lower() for t in search.split() if not t.startswith("-")]
+    words = []
+    for text in _strings(doc):
+        words.extend(re.findall(r"\w+", text.lower()))
+    return float(sum(words.count(t) for t in terms))
+
+
+def _match(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            ok = any(_match(doc, q) for q in cond)
+        elif key == "$and":
+            ok = all(_match(doc, q) for q in cond)
+        elif key == "$nor":
+            ok = not any(_match(doc, q) for q in cond)
+        elif key == "$text":
+            ok = _text_score(doc, cond["$search"]) > 0
+        elif _is_ops(cond):
+            ok = _match_ops(_get(doc, key), cond)
+        elif isinstance(cond, re.Pattern):
+            ok = _regex(_get(doc, key), cond)
+        else:
+            ok = _equals(_get(doc, key), cond)
+        if not ok:
+            return False
+    return True
+
+
+def _project(doc: dict, projection, query: dict) -> dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = dict([(field, 1) for field in projection])
+
+    fields = dict([(k, v) for k, v in projection.items() if not isinstance(v, dict)])
+    include_id = fields.pop("_id", 1)
+    if any(fields.values()):
+        out = dict()
+        if include_id and "_id" in doc:
+            out["_id"] = doc["_id"]
+        for field, on in fields.items():
+            value = _get(doc, field)
+            if on and value is not _MISSING:
+                _set(out, field, value)
+    else:
+        out = dict(doc)
+        for field in fields:
+            out.pop(field, None)
+        if not include_id:
+            out.pop("_id", None)
+
+    for field, spec in projection.items():
+        if not isinstance(spec, dict):
+            continue
+        if spec.get("$meta") == "textScore":
+            out[field] = _text_score(doc, query["$text"]["$search"])
+        elif "$slice" in spec:
+            value = doc.get(field, _MISSING)
+            if isinstance(value, list):
+                cut = spec["$slice"]
+                if isinstance(cut, list):
+                    value = value[cut[0] :][: cut[1]]
+                elif cut >= 0:
+                    value = value[:cut]
+                else:
+                    value = value[cut:]
+            if value is not _MISSING:
+                out[field] = value
+    return out
+
+
+# Applies an update document to a copy of doc and returns it
+def _apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    doc = copy.deepcopy(doc)
+    if not _is_ops(update):
+        # a replacement keeps only the _id of the old document
+        new = dict([("_id", doc["_id"])]) if "_id" in doc else dict()
+        new.update(copy.deepcopy(update))
+        return new
+
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$unset":
+                parts = path.split(".")
+                parent = _get(doc, ".".join(parts[:-1])) if len(parts) > 1 else doc
+                if isinstance(parent, dict):
+                    parent.pop(parts[-1], None)
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, value if current is _MISSING else current + value)
+            elif op == "$push":
+                current = _get(doc, path)
+                if current is _MISSING:
+                    current = []
+                    _set(doc, path, current)
+                if isinstance(value, dict) and "$each" in value:
+                    current.extend(copy.deepcopy(value["$each"]))
+                    if "$slice" in value:
+                        cut = value["$slice"]
+                        current[:] = current[:cut] if cut >= 0 else current[cut:]
+                else:
+                    current.append(copy.deepcopy(value))
+            elif op == "$pull":
+                current = _get(doc, path)
+                if isinstance(current, list):
+                    if _is_ops(value):
+                        current[:] = [v for v in current if not _match_ops(v, value)]
+                    else:
+                        current[:] = [v for v in current if not _equals(v, value)]
+            else:
+                raise NotImplementedError(f"update operator {op} is not supported")
+    return doc
+
+
+# Index keys have to be hashable, anything that is not is kept in the index's unkeyed set
+def _hashable(value) -> bool:
+    return value is None or isinstance(
+        value, (str, int, float, bool, bytes, ObjectId, bson.Int64)
+    )
+
+
+def _index_fields(keys) -> tuple:
+    if isinstance(keys, str):
+        return (keys,)
+    return tuple(
+        field
+        for field, kind in keys
+        if kind != pymongo.TEXT and not field.startswith("$")
+    )
+
+
+class _HashIndex:
+    def __init__(self, fields: tuple, unique: bool = False):
+        self.fields = fields
+        self.unique = unique
+        self.keys = dict()
+        self.unkeyed = set()
+
+    # Returns True if another document already has the same key as doc
+    def conflicts(self, doc: dict) -> bool:
+        key = self._key(doc)
+        if key is None:
+            return False
+        return len(self.keys.get(key, set()) - {doc["_id"]}) > 0
+
+    def _key(self, doc: dict):
+        key = tuple(doc.get(field) for field in self.fields)
+        if all(_hashable(part) for part in key):
+            return key
+        return None
+
+    def add(self, doc: dict) -> None:
+        key = self._key(doc)
+        if key is None:
+            self.unkeyed.add(doc["_id"])
+        else:
+            self.keys.setdefault(key, set()).add(doc["_id"])
+
+    def remove(self, doc: dict) -> None:
+        key = self._key(doc)
+        if key is None:
+            self.unkeyed.discard(doc["_id"])
+        else:
+            ids = self.keys.get(key)
+            if ids is not None:
+                ids.discard(doc["_id"])
+                if len(ids) == 0:
+                    del self.keys[key]
+
+    # Returns the ids that could match the query or None when the index cannot narrow it down
+    def lookup(self, query: dict):
+        choices = []
+        for field in self.fields:
+            cond = query.get(field, _MISSING)
+            if cond is _MISSING:
+                return None
+            if isinstance(cond, dict) and list(cond) == ["$in"]:
+                values = list(cond["$in"])
+            elif isinstance(cond, dict) and list(cond) == ["$eq"]:
+                values = [cond["$eq"]]
+            elif isinstance(cond, (dict, list, re.Pattern)):
+                return None
+            else:
+                values = [cond]
+            if not all(_hashable(v) for v in values):
+                return None
+            choices.append(values)
+
+        keys = [()]
+        for values in choices:
+            keys = [key + (value,) for key in keys for value in values]
+        ids = set(self.unkeyed)
+        for key in keys:
+            ids.update(self.keys.get(key, ()))
+        return ids
+
+
+class _Store:
+    def __init__(self, name: str, client, indexes: list = ()):
+        self.name = name
+        # the client holds the undo journal of the transaction in progress
+        self.client = client
+        # _id -> (decoded document, encoded bytes)
+        self.docs = dict()
+        self.indexes = dict()
+        for fields in indexes:
+            self.add_index(fields)
+
+    def add_index(self, fields: tuple, unique: bool = False) -> None:
+        if len(fields) == 0 or fields == ("_id",):
+            return
+        index = self.indexes.get(fields)
+        if index is None:
+            index = _HashIndex(fields)
+            for doc, _ in self.docs.values():
+                index.add(doc)
+            self.indexes[fields] = index
+        if unique and not index.unique:
+            if any(len(ids) > 1 for ids in index.keys.values()):
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {fields}",
+                    11000,
+                )
+            index.unique = True
+
+    def _journal(self, _id) -> None:
+        journal = self.client._journal
+        if journal is not None:
+            journal.append((self, _id, self.docs.get(_id)))
+
+    def put(self, doc: dict) -> None:
+        raw = bson.encode(doc)
+        # round trip through BSON so stored values look exactly like ones read back from a server
+        doc = bson.decode(raw)
+        for index in self.indexes.values():
+            if index.unique and index.conflicts(doc):
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {index.fields}",
+                    11000,
+                )
+        self._journal(doc["_id"])
+        self._replace(doc["_id"], (doc, raw))
+
+    def pop(self, _id) -> None:
+        self._journal(_id)
+        self._replace(_id, None)
+
+    # Swaps the stored entry for _id, None removes it. A replaced entry keeps its place in natural order, like a
+    # document updated in place on the server
+    def _replace(self, _id, entry) -> None:
+        old = self.docs.get(_id)
+        if old is not None:
+            for index in self.indexes.values():
+                index.remove(old[0])
+        if entry is None:
+            self.docs.pop(_id, None)
+        else:
+            self.docs[_id] = entry
+            for index in self.indexes.values():
+                index.add(entry[0])
+
+    # Returns (doc, raw) pairs matching query in insertion order, using the narrowest index available
+    def scan(self, query: dict):
+        ids = None
+        cond = query.get("_id", _MISSING)
+        if cond is not _MISSING and not isinstance(cond, dict) and _hashable(cond):
+            ids = {cond}
+        elif isinstance(cond, dict) and list(cond) == ["$in"]:
+            ids = set(v for v in cond["$in"] if _hashable(v))
+        else:
+            for fields in sorted(self.indexes, key=len, reverse=True):
+                ids = self.indexes[fields].lookup(query)
+                if ids is not None:
+                    break
+
+        if ids is None:
+            entries = list(self.docs.values())
+        elif len(ids) <= 1:
+            entries = [self.docs[i] for i in ids if i in self.docs]
+        else:
+            # walk the docs rather than the ids so results keep natural order whichever index was used
+            entries = [entry for i, entry in self.docs.items() if i in ids]
+        query = _prepare(query)
+        return [entry for entry in entries if _match(entry[0], query)]
+
+
+class MemoryCursor:
+    """Cursor over documents of a MemoryCollection, evaluated when it is first iterated"""
+
+    def __init__(self, collection, query: dict, projection=None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or pymongo.ASCENDING)]
+        self._sort = list(key_or_list)
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    def count(self, with_limit_and_skip: bool = False) -> int:
+        with self._collection.database.lock:
+            count = len(self._collection._store().scan(self._query))
+        if with_limit_and_skip:
+            count = max(count - self._skip, 0)
+            if self._limit:
+                count = min(count, abs(self._limit))
+        return count
+
+    def _evaluate(self) -> list:
+        with self._collection.database.lock:
+            entries = self._collection._store().scan(self._query)
+
+        if self._sort:
+            # stable sorts applied from the last key to the first give a multi key sort
+            for field, direction in reversed(self._sort):
+                if isinstance(direction, dict):
+                    search = self._query["$text"]["$search"]
+                    entries.sort(key=lambda e: _text_score(e[0], search), reverse=True)
+                else:
+                    entries.sort(
+                        key=lambda e: _sort_key(_get(e[0], field)),
+                        reverse=direction == pymongo.DESCENDING,
+                    )
+
+        entries = entries[self._skip :]
+        if self._limit:
+            entries = entries[: abs(self._limit)]
+        return [
+            self._collection._decode(doc, raw, self._projection, self._query)
+            for doc, raw in entries
+        ]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._results is None:
+            self._results = iter(self._evaluate())
+        return next(self._results)
+
+    next = __next__
+
+    def close(self) -> None:
+        self._results = iter(())
+
+
+class MemoryCollection:
+    """In memory stand in for a pymongo Collection"""
+
+    def __init__(self, database, name: str, codec_options=DEFAULT_CODEC_OPTIONS):
+        self.database = database
+        self.name = name
+        self.codec_options = codec_options
+
+    def _store(self) -> _Store:
+        return self.database._store(self.name)
+
+    def _decode(self, doc: dict, raw: bytes, projection=None, query: dict = None):
+        if projection:
+            raw = bson.encode(_project(doc, projection, query or {}))
+        return bson.decode(raw, self.codec_options)
+
+    def with_options(self, codec_options=None, **kwargs):
+        return MemoryCollection(
+            self.database, self.name, codec_options or self.codec_options
+        )
+
+    def find(self, filter: dict = None, projection=None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, _filter(filter), projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("skip"):
+            cursor.skip(kwargs["skip"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        for doc in self.find(filter, projection, **kwargs).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter: dict, **kwargs) -> int:
+        return self.find(filter, **kwargs).count(with_limit_and_skip=True)
+
+    def estimated_document_count(self, **kwargs) -> int:
+        with self.database.lock:
+            return len(self._store().docs)
+
+    def distinct(self, key: str, filter: dict = None, **kwargs) -> list:
+        values = []
+        with self.database.lock:
+            for doc, _ in self._store().scan(_filter(filter)):
+                value = _get(doc, key)
+                for item in value if isinstance(value, list) else [value]:
+                    if item is not _MISSING and item not in values:
+                        values.append(item)
+        return values
+
+    def _insert(self, store: _Store, document: dict) -> None:
+        if "_id" not in document:
+            # like pymongo, the generated _id is added to the caller's document
+            document["_id"] = ObjectId()
+        if document["_id"] in store.docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_",
+                11000,
+            )
+        store.put(document)
+
+    def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        with self.database.lock:
+            self._insert(self._store(), document)
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(
+        self, documents: list, ordered: bool = True, **kwargs
+    ) -> InsertManyResult:
+        errors = []
+        inserted = []
+        with self.database.lock:
+            store = self._store()
+            for n, document in enumerate(documents):
+                try:
+                    self._insert(store, document)
+                    inserted.append(document["_id"])
+                except DuplicateKeyError as err:
+                    errors.append(
+                        dict([("index", n), ("code", 11000), ("errmsg", str(err))])
+                    )
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError(
+                dict(
+                    [
+                        ("writeErrors", errors),
+                        ("writeConcernErrors", []),
+                        ("nInserted", len(inserted)),
+                        ("nUpserted", 0),
+                        ("nMatched", 0),
+                        ("nModified", 0),
+                        ("nRemoved", 0),
+                        ("upserted", []),
+                    ]
+                )
+            )
+        return InsertManyResult(inserted, True)
+
+    def _update(
+        self, filter: dict, update: dict, upsert: bool = False, multi: bool = False
+    ) -> dict:
+        with self.database.lock:
+            store = self._store()
+            entries = store.scan(_filter(filter))
+            if not multi:
+                entries = entries[:1]
+
+            modified = 0
+            for doc, _ in entries:
+                new = _apply_update(doc, update)
+                if new != doc:
+                    store.put(new)
+                    modified += 1
+
+            result = dict([("n", len(entries)), ("nModified", modified), ("ok", 1.0)])
+            if len(entries) == 0 and upsert:
+                seed = dict(
+                    [
+                        (k, v)
+                        for k, v in _filter(filter).items()
+                        if not k.startswith("$")
+                    ]
+                )
+                seed = dict([(k, v) for k, v in seed.items() if not _is_ops(v)])
+                new = _apply_update(seed, update, inserting=True)
+                if "_id" not in new:
+                    new["_id"] = seed.get("_id", ObjectId())
+                store.put(new)
+                result["n"] = 1
+                result["upserted"] = new["_id"]
+            result["updatedExisting"] = len(entries) > 0
+            return result
+
+    # pre 3.0 pymongo update, still used by the helper
+    def update(
+        self,
+        spec: dict,
+        document: dict,
+        upsert: bool = False,
+        multi: bool = False,
+        **kwargs,
+    ) -> dict:
+        return self._update(spec, document, upsert=upsert, multi=multi)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert=upsert), True)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return UpdateResult(
+            self._update(filter, update, upsert=upsert, multi=True), True
+        )
+
+    def replace_one(
+        self, filter: dict, replacement: dict, upsert: bool = False, **kwargs
+    ):
+        return UpdateResult(self._update(filter, replacement, upsert=upsert), True)
+
+    def _delete(self, filter: dict, multi: bool) -> DeleteResult:
+        with self.database.lock:
+            store = self._store()
+            entries = store.scan(_filter(filter))
+            if not multi:
+                entries = entries[:1]
+            for doc, _ in entries:
+                store.pop(doc["_id"])
+        return DeleteResult(dict([("n", len(entries)), ("ok", 1.0)]), True)
+
+    def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return self._delete(filter, multi=False)
+
+    def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return self._delete(filter, multi=True)
+
+    def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        fields = _index_fields(keys)
+        with self.database.lock:
+            self._store().add_index(fields, unique=unique)
+        if isinstance(keys, str):
+            keys = [(keys, pymongo.ASCENDING)]
+        return "_".join(f"{field}_{kind}" for field, kind in keys)
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+
+# Like pymongo, a filter that is not a document is a lookup by _id
+def _filter(filter) -> dict:
+    if filter is None:
+        return dict()
+    if not isinstance(filter, dict):
+        return dict([("_id", filter)])
+    return filter
+
+
+class MemoryDatabase:
+    """In memory stand in for a pymongo Database"""
+
+    def __init__(self, name: str = "shdb", client=None):
+        self.name = name
+        if client is None:
+            client = MemoryClient(name)
+            client._databases[name] = self
+        self.client = client
+        # the client's lock keeps every operation atomic across threads and serializes transactions
+        self.lock = client.lock
+        self._stores = dict()
+
+    def _store(self, name: str) -> _Store:
+        store = self._stores.get(name)
+        if store is None:
+            store = _Store(name, self.client, DEFAULT_INDEXES.get(name, ()))
+            self._stores[name] = store
+        return store
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return MemoryCollection(self, name)
+
+    def get_collection(self, name: str, codec_options=None, **kwargs):
+        return MemoryCollection(self, name, codec_options or DEFAULT_CODEC_OPTIONS)
+
+    def list_collection_names(self, **kwargs) -> list:
+        with self.lock:
+            return list(self._stores)
+
+    def create_collection(self, name: str, **kwargs) -> MemoryCollection:
+        with self.lock:
+            if name in self._stores:
+                raise CollectionInvalid(f"collection {name} already exists")
+            self._store(name)
+        return self[name]
+
+    def drop_collection(self, name: str) -> None:
+        with self.lock:
+            self._stores.pop(name, None)
+
+
+class MemoryClient:
+    """In memory stand in for a pymongo MongoClient"""
+
+    def __init__(self, default_database: str = "shdb"):
+        self._default = default_database
+        self._databases = dict()
+        self.lock = threading.RLock()
+        # (store, _id, previous entry) for every write of the transaction in progress, None outside of one
+        self._journal = None
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name, client=self)
+        return self._databases[name]
+
+    def get_database(self, name: str = None, **kwargs) -> MemoryDatabase:
+        return self[name or self._default]
+
+    def get_default_database(self, **kwargs) -> MemoryDatabase:
+        return self[self._default]
+
+    def start_session(self, **kwargs):
+        return MemorySession(self)
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySession:
+    """In memory stand in for a pymongo ClientSession
+
+    A transaction holds the client lock until it ends, so transactions run one at a time and never conflict. When
+    the callback raises, every write it made is undone from the journal.
+    """
+
+    def __init__(self, client: MemoryClient):
+        self.client = client
+        self.in_transaction = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.end_session()
+
+    def end_session(self) -> None:
+        pass
+
+    def with_transaction(self, callback, **kwargs):
+        with self.client.lock:
+            if self.client._journal is not None:
+                raise InvalidOperation("Transaction already in progress")
+            self.client._journal = []
+            self.in_transaction = True
+            try:
+                result = callback(self)
+            except BaseException:
+                for store, _id, entry in reversed(self.client._journal):
+                    store._replace(_id, entry)
+                raise
+            finally:
+                self.client._journal = None
+                self.in_transaction = False
+            return result
@@ -0,0 +1,269 @@
+import contextvars
+import functools
+import threading
+import time
+
+import bson
+from pymongo import monitoring
+
+# latency histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# (Metrics, method name) of the MongoHelper call running in this thread or task, None outside of one
+_current = contextvars.ContextVar("mongo_helper_call", default=None)
+
+
+class MethodStats:
+    """Counters and latency histogram for one MongoHelper method"""
+
+    __slots__ = (
+        "buckets",
+        "bucket_counts",
+        "seconds",
+        "calls",
+        "failures",
+        "errors",
+        "round_trips",
+        "docs_read",
+        "docs_written",
+        "bytes_read",
+        "bytes_written",
+    )
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.seconds = 0.0
+        self.calls = 0
+        # failures are {"status": "Failed"} results, errors are raised exceptions
+        self.failures = 0
+        self.errors = 0
+        self.round_trips = 0
+        self.docs_read = 0
+        self.docs_written = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def observe(self, seconds: float) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        for n, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[n] += 1
+                break
+
+    def as_dict(self) -> dict:
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+
+class Metrics:
+    """Collects per method metrics for a MongoHelper
+
+    Pass an instance as MongoHelper(metrics=...). Driver commands are counted through CommandMetrics, which has to
+    be registered with the MongoClient (MongoHelper does this for the client it creates itself).
+
+    The driver does not report the size of what it sends and receives, so bytes_read and bytes_written are only
+    counted with measure_bytes=True. Each command and reply is then encoded to BSON a second time, which roughly
+    doubles serialization cost on large documents such as files with a long line_history.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, measure_bytes: bool = False):
+        self.buckets = tuple(buckets)
+        self.measure_bytes = measure_bytes
+        self.methods = dict()
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def _stats(self, method: str) -> MethodStats:
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods.setdefault(method, MethodStats(self.buckets))
+        return stats
+
+    # hook(method, seconds, failed, error) is called after every instrumented call
+    def add_hook(self, hook) -> None:
+        self.hooks.append(hook)
+
+    def record_call(
+        self, method: str, seconds: float, failed: bool, error: BaseException = None
+    ) -> None:
+        with self._lock:
+            stats = self._stats(method)
+            stats.observe(seconds)
+            if error is not None:
+                stats.errors += 1
+            elif failed:
+                stats.failures += 1
+        for hook in self.hooks:
+            hook(method, seconds, failed, error)
+
+    def record_command(
+        self,
+        method: str,
+        round_trips: int = 0,
+        docs_read: int = 0,
+        docs_written: int = 0,
+        bytes_read: int = 0,
+        bytes_written: int = 0,
+    ) -> None:
+        with self._lock:
+            stats = self._stats(method)
+            stats.round_trips += round_trips
+            stats.docs_read += docs_read
+            stats.docs_written += docs_written
+            stats.bytes_read += bytes_read
+            stats.bytes_written += bytes_written
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict([(m, s.as_dict()) for m, s in self.methods.items()])
+
+    def reset(self) -> None:
+        with self._lock:
+            self.methods = dict()
+
+    def to_prometheus(self, prefix: str = "mongo_helper") -> str:
+        """Returns the metrics in the Prometheus text exposition format
+
+        :param prefix: prefix for every metric name
+        :type prefix: str
+
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_call_seconds Latency of MongoHelper calls",
+            f"# TYPE {prefix}_call_seconds histogram",
+        ]
+        for method, stats in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, stats["bucket_counts"]):
+                cumulative += count
+                lines.append(
+                    f'{prefix}_call_seconds_bucket{{method="{method}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'{prefix}_call_seconds_bucket{{method="{method}",le="+Inf"}} {stats["calls"]}'
+            )
+            lines.append(
+                f'{prefix}_call_seconds_sum{{method="{method}"}} {stats["seconds"]}'
+            )
+            lines.append(
+                f'{prefix}_call_seconds_count{{method="{method}"}} {stats["calls"]}'
+            )
+
+        for name, help_text in (
+            ("failures", "Calls that returned a Failed status"),
+            ("errors", "Calls that raised an exception"),
+            ("round_trips", "Commands sent to the server"),
+            ("docs_read", "Documents returned by the server"),
+            ("docs_written", "Documents inserted, updated or deleted"),
+            ("bytes_read", "BSON bytes received from the server"),
+            ("bytes_written", "BSON bytes sent to the server"),
+        ):
+            if name.startswith("bytes_") and not self.measure_bytes:
+                continue
+            lines.append(f"# HELP {prefix}_{name}_total {help_text}")
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for method, stats in sorted(snapshot.items()):
+                lines.append(
+                    f'{prefix}_{name}_total{{method="{method}"}} {stats[name]}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo command listener that charges every command to the MongoHelper call that issued it"""
+
+    def started(self, event) -> None:
+        current = _current.get()
+        if current is None:
+            return
+        metrics, method = current
+        bytes_written = 0
+        if metrics.measure_bytes:
+            bytes_written = len(bson.encode(event.command))
+        metrics.record_command(method, round_trips=1, bytes_written=bytes_written)
+
+    def succeeded(self, event) -> None:
+        current = _current.get()
+        if current is None:
+            return
+        metrics, method = current
+        reply = event.reply
+        docs_read = 0
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            docs_read = len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+        docs_written = 0
+        if event.command_name in ("insert", "update", "delete"):
+            docs_written = reply.get("n", 0)
+        bytes_read = 0
+        if metrics.measure_bytes:
+            bytes_read = len(bson.encode(reply))
+        metrics.record_command(
+            method,
+            docs_read=docs_read,
+            docs_written=docs_written,
+            bytes_read=bytes_read,
+        )
+
+    def failed(self, event) -> None:
+        pass
+
+
+# shared listener, it keeps no state of its own so one instance serves every client
+COMMAND_LISTENER = CommandMetrics()
+
+
+# Wraps a MongoHelper method so its calls are timed and the commands it issues are attributed to it. Calls made
+# from inside another instrumented call are charged to the outer call, which is the one the caller made
+def instrumented(fn):
+    method = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None or _current.get() is not None:
+            return fn(self, *args, **kwargs)
+
+        token = _current.set((metrics, method))
+        start = time.perf_counter()
+        failed = False
+        error = None
+        try:
+            result = fn(self, *args, **kwargs)
+            failed = isinstance(result, dict) and result.get("status") == "Failed"
+            return result
+        except BaseException as err:
+            error = err
+            raise
+        finally:
+            _current.reset(token)
+            metrics.record_call(method, time.perf_counter() - start, failed, error)
+
+    return wrapper
+
+
+# Class decorator that instruments every public instance method
+def instrument_methods(cls):
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, (staticmethod, classmethod)):
+            continue
+        if not name.startswith("_") and callable(attr):
+            setattr(cls, name, instrumented(attr))
+    return cls
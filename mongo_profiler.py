@@ -0,0 +1,238 @@
+import contextlib
+import sys
+from collections import Counter, namedtuple
+
+# collection methods that go to the server as soon as they are called
+DIRECT_OPERATIONS = {
+    "find_one",
+    "insert_one",
+    "insert_many",
+    "update",
+    "update_one",
+    "update_many",
+    "replace_one",
+    "delete_one",
+    "delete_many",
+    "distinct",
+    "count_documents",
+    "create_index",
+    "bulk_write",
+}
+
+# operations that only read, these are the ones worth flagging when the same one is repeated
+READ_OPERATIONS = {"find", "find_one", "distinct", "count", "count_documents"}
+
+# one query issued inside a profile_queries block. caller is the chain of MongoHelper methods that issued it,
+# outermost first
+Query = namedtuple("Query", ["collection", "operation", "shape", "filter", "caller"])
+
+
+class RoundTripBudgetExceeded(AssertionError):
+    """Raised when a profile_queries block issues more round trips than its budget"""
+
+
+# Replaces every value in a filter with ? so queries that only differ by their values have the same shape
+def query_shape(value) -> str:
+    if isinstance(value, dict):
+        items = ", ".join(f"{k}: {query_shape(v)}" for k, v in value.items())
+        return "{" + items + "}"
+    if isinstance(value, (list, tuple)) and any(isinstance(v, dict) for v in value):
+        return "[" + ", ".join(query_shape(v) for v in value) + "]"
+    return "?"
+
+
+class QueryProfile:
+    """Every query issued inside a profile_queries block"""
+
+    def __init__(self, helper):
+        self.helper = helper
+        self.queries = []
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.queries)
+
+    def record(self, collection: str, operation: str, filter) -> None:
+        self.queries.append(
+            Query(
+                collection,
+                operation,
+                query_shape(filter),
+                repr(filter),
+                self._caller(),
+            )
+        )
+
+    # Walks the stack for frames of the profiled helper's methods
+    def _caller(self) -> tuple:
+        chain = []
+        frame = sys._getframe(1)
+        cls = type(self.helper)
+        while frame is not None:
+            name = frame.f_code.co_name
+            if frame.f_locals.get("self") is self.helper and hasattr(cls, name):
+                if not chain or chain[-1] != name:
+                    chain.append(name)
+            frame = frame.f_back
+        return tuple(reversed(chain))
+
+    def repeated(self) -> list:
+        """returns reads that were issued more than once with the exact same filter
+
+        :rtype: list[tuple[Query, int]], the query and how many times it was issued
+        """
+        counts = Counter(
+            (q.collection, q.operation, q.filter)
+            for q in self.queries
+            if q.operation in READ_OPERATIONS
+        )
+        first = dict()
+        for q in self.queries:
+            first.setdefault((q.collection, q.operation, q.filter), q)
+        return [(first[key], n) for key, n in counts.items() if n > 1]
+
+    def loops(self, threshold: int = 3) -> list:
+        """returns query shapes issued at least threshold times, the usual sign of a query per item
+
+        :param threshold: number of queries of one shape that counts as a loop
+        :type threshold: int
+
+        :rtype: list[tuple[Query, int]], the first query of the shape and how many times it was issued
+        """
+        counts = Counter((q.collection, q.operation, q.shape) for q in self.queries)
+        first = dict()
+        for q in self.queries:
+            first.setdefault((q.collection, q.operation, q.shape), q)
+        return [(first[key], n) for key, n in counts.items() if n >= threshold]
+
+    def report(self, threshold: int = 3) -> str:
+        lines = [f"{self.round_trips} round trips"]
+        for q, n in self.repeated():
+            lines.append(
+                f"  repeated {n}x: {q.collection}.{q.operation} {q.filter} from {' > '.join(q.caller)}"
+            )
+        for q, n in self.loops(threshold):
+            lines.append(
+                f"  loop {n}x: {q.collection}.{q.operation} {q.shape} from {' > '.join(q.caller)}"
+            )
+        return "\n".join(lines)
+
+
+# Cursors only reach the server once they are read or counted
+class _ProfilingCursor:
+    def __init__(self, cursor, profile: QueryProfile, collection: str, filter):
+        self._cursor = cursor
+        self._profile = profile
+        self._collection = collection
+        self._filter = filter
+        self._started = False
+
+    def _start(self) -> None:
+        if not self._started:
+            self._started = True
+            self._profile.record(self._collection, "find", self._filter)
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size"):
+
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+
+            return chain
+        if name == "count":
+            self._profile.record(self._collection, "count", self._filter)
+        return attr
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._start()
+        return next(self._cursor)
+
+    next = __next__
+
+
+class _ProfilingCollection:
+    def __init__(self, collection, profile: QueryProfile, name: str):
+        self._collection = collection
+        self._profile = profile
+        self._name = name
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name == "find":
+
+            def find(*args, **kwargs):
+                filter = args[0] if args else kwargs.get("filter")
+                return _ProfilingCursor(
+                    attr(*args, **kwargs), self._profile, self._name, filter
+                )
+
+            return find
+        if name == "with_options":
+            return lambda *args, **kwargs: _ProfilingCollection(
+                attr(*args, **kwargs), self._profile, self._name
+            )
+        if name in DIRECT_OPERATIONS:
+
+            def call(*args, **kwargs):
+                if name == "distinct":
+                    filter = args[1] if len(args) > 1 else kwargs.get("filter")
+                else:
+                    filter = args[0] if args else None
+                self._profile.record(self._name, name, filter)
+                return attr(*args, **kwargs)
+
+            return call
+        return attr
+
+
+class _ProfilingDatabase:
+    def __init__(self, db, profile: QueryProfile):
+        self._db = db
+        self._profile = profile
+
+    def __getitem__(self, name: str):
+        return _ProfilingCollection(self._db[name], self._profile, name)
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if name in ("list_collection_names", "create_collection"):
+
+            def call(*args, **kwargs):
+                self._profile.record("", name, args[0] if args else None)
+                return attr(*args, **kwargs)
+
+            return call
+        return attr
+
+
+@contextlib.contextmanager
+def profile_queries(helper, budget: int = None):
+    """Records every query a MongoHelper issues inside the block
+
+    The helper's db is swapped for a recording proxy for the duration of the block, so it should not be shared
+    with other threads while profiling.
+
+    :param helper: helper to profile
+    :type helper: MongoHelper
+
+    :param budget: max round trips allowed, RoundTripBudgetExceeded is raised on exit when it is exceeded
+    :type budget: int or none
+
+    :rtype: QueryProfile
+    """
+    profile = QueryProfile(helper)
+    db = helper.db
+    helper.db = _ProfilingDatabase(db, profile)
+    try:
+        yield profile
+    finally:
+        helper.db = db
+    if budget is not None and profile.round_trips > budget:
+        raise RoundTripBudgetExceeded(
+            f"budget of {budget} round trips exceeded\n{profile.report()}"
+        )
@@ -0,0 +1,184 @@
+"""Typed results for the MongoHelper *_record and function_table methods
+
+Records keep their fields in __slots__ instead of a dict per document, and a lookup that finds nothing returns a
+Miss, which is falsy, instead of a {"status": "Failed"} dict:
+
+    file = helper.file_record(owner, repo, branch, path)
+    if not file:
+        print(file.reason)
+"""
+
+
+class Miss:
+    """Result of a lookup that found nothing. Always falsy"""
+
+    __slots__ = ("reason",)
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return f"Miss({self.reason!r})"
+
+
+class _Record:
+    __slots__ = ()
+
+    # fields whose document key is not the same as the attribute name
+    _keys = dict([("id", "_id")])
+
+    @classmethod
+    def from_doc(cls, doc):
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, doc.get(cls._keys.get(field, field)))
+        return record
+
+    def to_dict(self) -> dict:
+        return dict(
+            [
+                (self._keys.get(field, field), getattr(self, field))
+                for field in self.__slots__
+            ]
+        )
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class RepoRecord(_Record):
+    __slots__ = ("id", "owner", "repo", "branch", "last_write")
+
+
+class FileRecord(_Record):
+    __slots__ = (
+        "id",
+        "repo_id",
+        "path",
+        "last_commit",
+        "commits",
+        "file_lock",
+        "line_history",
+    )
+
+
+class UserRecord(_Record):
+    # the salt and password hash are left out on purpose
+    __slots__ = ("id", "user_name", "first_name", "last_name", "email", "dev_access")
+
+
+class _Absent:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "<absent>"
+
+    # copies and pickles of a table have to keep using the one marker
+    def __reduce__(self) -> str:
+        return "_ABSENT"
+
+
+# marks a field a function document did not have, so it can be told apart from a stored None
+_ABSENT = _Absent()
+
+
+class FunctionRecord:
+    """One row of a FunctionTable. Fields are read from the table's columns, any stored field works as an attribute
+    or item, e.g. func.name or func["start_line"]"""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index: int):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, field: str):
+        # copy and pickle look up dunders on instances that have no _table yet
+        if field.startswith("_"):
+            raise AttributeError(field)
+        value = self.get(_Record._keys.get(field, field), _ABSENT)
+        if value is _ABSENT:
+            raise AttributeError(field)
+        return value
+
+    def __getitem__(self, field: str):
+        value = self.get(field, _ABSENT)
+        if value is _ABSENT:
+            raise KeyError(field)
+        return value
+
+    def get(self, field: str, default=None):
+        column = self._table.columns.get(field)
+        if column is None or column[self._index] is _ABSENT:
+            return default
+        return column[self._index]
+
+    def to_dict(self) -> dict:
+        return dict(
+            [
+                (field, column[self._index])
+                for field, column in self._table.columns.items()
+                if column[self._index] is not _ABSENT
+            ]
+        )
+
+    def __repr__(self) -> str:
+        return f"FunctionRecord({self.to_dict()!r})"
+
+
+class FunctionTable:
+    """The functions of a file stored column wise: one list per field rather than one dict per function"""
+
+    __slots__ = ("columns", "_length", "_by_name")
+
+    def __init__(self, docs):
+        self.columns = dict()
+        self._length = 0
+        self._by_name = None
+        for doc in docs:
+            for field, value in doc.items():
+                column = self.columns.get(field)
+                if column is None:
+                    column = self.columns[field] = [_ABSENT] * self._length
+                column.append(value)
+            self._length += 1
+            # fields this document did not have
+            for column in self.columns.values():
+                if len(column) < self._length:
+                    column.append(_ABSENT)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> FunctionRecord:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return FunctionRecord(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield FunctionRecord(self, index)
+
+    def column(self, field: str) -> list:
+        """returns every function's value of one field, None where it is not stored"""
+        column = self.columns.get(field, [None] * self._length)
+        return [None if value is _ABSENT else value for value in column]
+
+    def find(self, name: str):
+        """returns the function with the given name or a Miss"""
+        if self._by_name is None:
+            names = self.columns.get("name", ())
+            self._by_name = dict([(n, i) for i, n in enumerate(names)])
+        index = self._by_name.get(name)
+        if index is None:
+            return Miss(f"no function named {name}")
+        return FunctionRecord(self, index)
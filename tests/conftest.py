@@ -0,0 +1,33 @@
+import os
+
+import pymongo
+import pytest
+
+from mongo_helper import MongoHelper
+from mongo_memory import MemoryDatabase
+
+OWNER = "owner"
+REPO = "repo"
+BRANCH = "main"
+
+# the helper tests run on the in memory engine, and on a real server as well when MONGO_TEST_URI is set
+BACKENDS = ["memory"] + (["mongodb"] if os.environ.get("MONGO_TEST_URI") else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def helper(request):
+    client = None
+    if request.param == "memory":
+        db = MemoryDatabase("shdb_test")
+    else:
+        client = pymongo.MongoClient(os.environ["MONGO_TEST_URI"])
+        client.drop_database("shdb_test")
+        db = client["shdb_test"]
+
+    helper = MongoHelper(db=db)
+    helper.create_indexes()
+    helper.write_repo(OWNER, REPO, BRANCH)
+    yield helper
+    if client is not None:
+        client.drop_database("shdb_test")
+        client.close()
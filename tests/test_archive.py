@@ -0,0 +1,135 @@
+import datetime
+
+from bson import ObjectId
+
+from benchmarks.synthetic import make_file
+from mongo_helper import (
+    FILE_ARCHIVE_COL,
+    FILE_COL,
+    FUNC_ARCHIVE_COL,
+    FUNC_COL,
+    REPO_COL,
+)
+from tests.conftest import BRANCH, OWNER, REPO
+
+
+def _archive(helper) -> dict:
+    file_data = make_file(1, 3, 5)
+    helper.write_file(file_data, OWNER, REPO, BRANCH)
+    assert helper.archive_branch(OWNER, REPO, BRANCH)["status"] == "Success"
+    return file_data
+
+
+def test_archive_and_restore(helper):
+    file_data = _archive(helper)
+    assert helper.db[FILE_COL].find_one(dict([("path", file_data["path"])])) is None
+
+    assert helper.restore_branch(OWNER, REPO, BRANCH)["status"] == "Success"
+    doc = helper.get_file(OWNER, REPO, BRANCH, file_data["path"])
+    assert doc["line_history"] == file_data["line_history"]
+    funcs = helper.get_functions(OWNER, REPO, BRANCH, file_data["path"])
+    assert len(funcs["functions"]) == 3
+    assert helper.db[FUNC_ARCHIVE_COL].find_one({}) is None
+
+
+def test_restore_skips_copies_of_an_interrupted_move(helper):
+    _archive(helper)
+    # the function was copied back but the restore stopped before deleting it from the archive
+    helper.db[FUNC_COL].insert_one(helper.db[FUNC_ARCHIVE_COL].find_one({}))
+
+    assert helper.restore_branch(OWNER, REPO, BRANCH)["status"] == "Success"
+    assert helper.db[FUNC_ARCHIVE_COL].find_one({}) is None
+    assert len(list(helper.db[FUNC_COL].find({}))) == 3
+
+
+def test_restore_does_not_drop_a_differing_document(helper):
+    _archive(helper)
+    copy = helper.db[FUNC_ARCHIVE_COL].find_one({})
+    copy["user_score"] = 99
+    helper.db[FUNC_COL].insert_one(copy)
+
+    assert helper.restore_branch(OWNER, REPO, BRANCH)["status"] == "Failed"
+    assert (
+        helper.db[FUNC_ARCHIVE_COL].find_one(dict([("_id", copy["_id"])])) is not None
+    )
+    assert helper.db[FILE_ARCHIVE_COL].find_one({}) is not None
+
+
+def test_restore_does_not_drop_a_file_written_since(helper):
+    file_data = _archive(helper)
+    archived = helper.db[FILE_ARCHIVE_COL].find_one({})
+    newer = dict([("repo_id", archived["repo_id"]), ("path", file_data["path"])])
+    helper.db[FILE_COL].insert_one(newer)
+
+    assert helper.restore_branch(OWNER, REPO, BRANCH)["status"] == "Failed"
+    # neither the archived file nor its functions were touched
+    assert helper.db[FILE_ARCHIVE_COL].find_one(dict([("_id", archived["_id"])]))
+    assert len(list(helper.db[FUNC_ARCHIVE_COL].find({}))) == 3
+    assert helper.db[FUNC_COL].find_one({}) is None
+
+
+def test_transparent_restore_conflict_is_a_failed_result(helper):
+    file_data = _archive(helper)
+    archived = helper.db[FILE_ARCHIVE_COL].find_one({})
+    newer = dict([("repo_id", archived["repo_id"]), ("path", file_data["path"])])
+    helper.db[FILE_COL].insert_one(newer)
+
+    repo = helper.get_repo(OWNER, REPO, BRANCH)
+    assert repo["status"] == "Failed"
+    assert "could not be restored" in repo["reason"]
+    assert helper.get_repo_id(OWNER, REPO, BRANCH)["repo_id"] == "Failed"
+    assert not helper.repo_record(OWNER, REPO, BRANCH)
+    doc = helper.get_file(OWNER, REPO, BRANCH, file_data["path"])
+    assert doc["status"] == "Failed"
+    assert "could not be restored" in doc["reason"]
+    result = helper.write_file(file_data, OWNER, REPO, BRANCH)
+    assert result["status"] == "Failed"
+    # the archived branch is not shadowed by a new repo document
+    assert helper.write_repo(OWNER, REPO, BRANCH)["status"] == "Failed"
+    assert helper.db[FILE_ARCHIVE_COL].find_one(dict([("_id", archived["_id"])]))
+
+
+def test_write_file_stamps_last_write_only_when_stale(helper):
+    repo_id = helper.get_repo_id(OWNER, REPO, BRANCH)["repo_id"]
+    stale = datetime.datetime(2020, 1, 1)
+    helper.db[REPO_COL].update_one(
+        dict([("_id", repo_id)]), {"$set": dict([("last_write", stale)])}
+    )
+    helper.write_file(make_file(1, 2, 2), OWNER, REPO, BRANCH)
+    stamped = helper.get_repo(OWNER, REPO, BRANCH)["last_write"]
+    assert stamped > stale
+
+    helper.write_file(make_file(1, 2, 2, commits=2), OWNER, REPO, BRANCH)
+    assert helper.get_repo(OWNER, REPO, BRANCH)["last_write"] == stamped
+
+
+def test_archive_stale_branches(helper):
+    old = datetime.datetime(2020, 1, 1)
+    helper.write_file(make_file(1, 2, 2), OWNER, REPO, BRANCH)
+    repo_id = helper.get_repo_id(OWNER, REPO, BRANCH)["repo_id"]
+    helper.db[REPO_COL].update_one(
+        dict([("_id", repo_id)]), {"$set": dict([("last_write", old)])}
+    )
+    # created before last_write was tracked
+    helper.db[REPO_COL].insert_one(
+        dict(
+            [
+                ("_id", ObjectId.from_datetime(old)),
+                ("owner", OWNER),
+                ("repo", REPO),
+                ("branch", "legacy"),
+            ]
+        )
+    )
+    helper.write_repo(OWNER, REPO, "fresh")
+    helper.db[REPO_COL].insert_one(
+        dict([("owner", OWNER), ("repo", REPO), ("branch", "fresh-legacy")])
+    )
+
+    archived = helper.archive_stale_branches(days=30)["archived"]
+    assert sorted(archived) == [
+        f"{OWNER} - {REPO} - legacy",
+        f"{OWNER} - {REPO} - {BRANCH}",
+    ]
+    assert helper.db[FILE_COL].find_one({}) is None
+    assert helper.db[REPO_COL].find_one(dict([("branch", "fresh")])) is not None
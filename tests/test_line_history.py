@@ -0,0 +1,90 @@
+from benchmarks.synthetic import make_file
+from mongo_helper import FILE_COL, HISTORY_SEGMENTS
+from tests.conftest import BRANCH, OWNER, REPO
+
+
+def _entries(commits: int, count: int) -> list:
+    return [
+        dict([("commit", f"c{commits}"), ("line", line), ("change", "added")])
+        for line in range(count)
+    ]
+
+
+# Writes commits 1..n of one file, each adding count entries to the previous history
+def _write_commits(helper, n: int, count: int = 2) -> dict:
+    file_data = make_file(1, 2, 0)
+    history = []
+    for commits in range(1, n + 1):
+        history = history + _entries(commits, count)
+        file_data = dict(file_data)
+        file_data["commits"] = commits
+        file_data["last_commit"] = f"c{commits}"
+        file_data["line_history"] = history
+        assert helper.write_file(file_data, OWNER, REPO, BRANCH)["status"] == "Success"
+    return file_data
+
+
+def _commits(result: dict) -> list:
+    return sorted(set(entry["commit"] for entry in result["line_history"]))
+
+
+def test_reads_return_the_whole_history_without_bookkeeping(helper):
+    file_data = _write_commits(helper, 3)
+    path = file_data["path"]
+    doc = helper.get_file(OWNER, REPO, BRANCH, path)
+    assert doc["line_history"] == file_data["line_history"]
+    assert "history_index" not in doc
+    assert "history_index" not in helper.get_file(OWNER, REPO, BRANCH, path, raw=True)
+    for doc in helper.get_all_repo_files(OWNER, REPO, BRANCH)["files"]:
+        assert "history_index" not in doc
+    page = helper.get_all_repo_files(OWNER, REPO, BRANCH, page_size=1)
+    assert "history_index" not in page["files"][0]
+    files = helper.get_files_many(OWNER, REPO, BRANCH, [path])["files"]
+    assert "history_index" not in files[path]
+    assert b"history_index" not in helper.get_file_bytes(OWNER, REPO, BRANCH, path)
+
+
+def test_get_line_history_ranges(helper):
+    path = _write_commits(helper, 4)["path"]
+    full = helper.get_line_history(OWNER, REPO, BRANCH, path)
+    assert _commits(full) == ["c1", "c2", "c3", "c4"]
+    assert (full["commits"], full["last_commit"]) == (4, "c4")
+
+    since = helper.get_line_history(OWNER, REPO, BRANCH, path, since=2)
+    assert _commits(since) == ["c3", "c4"]
+    between = helper.get_line_history(OWNER, REPO, BRANCH, path, since=1, until=2)
+    assert _commits(between) == ["c2"]
+    assert (
+        helper.get_line_history(OWNER, REPO, BRANCH, path, since=4)["line_history"]
+        == []
+    )
+
+
+def test_rewritten_history_replaces_the_index(helper):
+    file_data = _write_commits(helper, 3)
+    file_data = dict(file_data)
+    file_data["commits"] = 4
+    file_data["last_commit"] = "c4"
+    file_data["line_history"] = _entries(4, 3)
+    helper.write_file(file_data, OWNER, REPO, BRANCH)
+
+    path = file_data["path"]
+    assert helper.get_file(OWNER, REPO, BRANCH, path)["line_history"] == _entries(4, 3)
+    # commits before the rewrite are no longer told apart, the whole history is returned
+    since = helper.get_line_history(OWNER, REPO, BRANCH, path, since=2)
+    assert since["line_history"] == _entries(4, 3)
+
+
+def test_segments_are_capped(helper):
+    writes = HISTORY_SEGMENTS + 5
+    file_data = _write_commits(helper, writes, count=1)
+    path = file_data["path"]
+    doc = helper.db[FILE_COL].find_one(dict([("path", path)]))
+    assert len(doc["history_index"]["segments"]) == HISTORY_SEGMENTS
+    assert doc["line_history"] == file_data["line_history"]
+
+    recent = helper.get_line_history(OWNER, REPO, BRANCH, path, since=writes - 2)
+    assert _commits(recent) == sorted([f"c{writes - 1}", f"c{writes}"])
+    # a since older than the kept segments starts from the beginning of the history
+    old = helper.get_line_history(OWNER, REPO, BRANCH, path, since=1)
+    assert old["line_history"] == file_data["line_history"]
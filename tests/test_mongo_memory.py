@@ -0,0 +1,211 @@
+"""Helper calls whose results the in memory engine has to reproduce exactly, ordering included"""
+
+import pytest
+
+from benchmarks.synthetic import make_file
+from tests.conftest import BRANCH, OWNER, REPO
+from mongo_helper import FILE_COL, FUNC_COL
+from mongo_memory import MemoryDatabase
+
+
+def _names(docs: list) -> list:
+    return [doc["name"] for doc in docs]
+
+
+def _write(helper, index: int, functions: int = 3, commits: int = 1) -> dict:
+    file_data = make_file(index, functions, 5, commits=commits)
+    result = helper.write_file(file_data, OWNER, REPO, BRANCH)
+    assert result["status"] == "Success"
+    return file_data
+
+
+def test_get_repo_and_missing_repo(helper):
+    repo = helper.get_repo(OWNER, REPO, BRANCH)
+    assert (repo["owner"], repo["repo"], repo["branch"]) == (OWNER, REPO, BRANCH)
+    assert helper.get_repo(OWNER, REPO, "other")["status"] == "Failed"
+    assert helper.write_repo(OWNER, REPO, BRANCH)["status"] == "Failed"
+
+
+def test_get_file_round_trips_the_written_fields(helper):
+    file_data = _write(helper, 1)
+    doc = helper.get_file(OWNER, REPO, BRANCH, file_data["path"])
+    assert doc["last_commit"] == file_data["last_commit"]
+    assert doc["commits"] == file_data["commits"]
+    assert doc["line_history"] == file_data["line_history"]
+    assert doc["file_lock"] is False
+
+
+def test_functions_keep_insertion_order_after_updates(helper):
+    file_data = _write(helper, 1, functions=4)
+    path = file_data["path"]
+    expected = _names(file_data["functions"])
+
+    helper.update_user_score(OWNER, REPO, BRANCH, path, expected[0], 5)
+    helper.update_user_score(OWNER, REPO, BRANCH, path, expected[2], 7)
+    funcs = helper.get_functions(OWNER, REPO, BRANCH, path)["functions"]
+    assert _names(funcs) == expected
+    assert [f["user_score"] for f in funcs] == [5, 0, 7, 0]
+
+    # a newer analysis rewrites the functions but keeps their scores
+    _write(helper, 1, functions=4, commits=2)
+    funcs = helper.get_functions(OWNER, REPO, BRANCH, path)["functions"]
+    assert _names(funcs) == expected
+    assert [f["user_score"] for f in funcs] == [5, 0, 7, 0]
+
+
+def test_files_keep_insertion_order_after_updates(helper):
+    paths = [_write(helper, i)["path"] for i in range(4)]
+    helper.update_lock(OWNER, REPO, BRANCH, paths[0], True)
+    _write(helper, 1, commits=2)
+
+    files = helper.get_all_repo_files(OWNER, REPO, BRANCH)["files"]
+    assert [f["path"] for f in files] == paths
+    assert [f["file_lock"] for f in files] == [True, False, False, False]
+
+
+def test_pages_cover_every_file_once(helper):
+    paths = [_write(helper, i)["path"] for i in range(5)]
+    seen = []
+    cursor = None
+    while True:
+        page = helper.get_all_repo_files(
+            OWNER, REPO, BRANCH, page_size=2, cursor=cursor
+        )
+        seen.extend(f["path"] for f in page["files"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == paths
+
+
+@pytest.mark.parametrize("page_size", [0, -1])
+def test_page_size_below_one_is_rejected(helper, page_size):
+    path = _write(helper, 1)["path"]
+    files = helper.get_all_repo_files(OWNER, REPO, BRANCH, page_size=page_size)
+    assert files["status"] == "Failed"
+    funcs = helper.get_functions(OWNER, REPO, BRANCH, path, page_size=page_size)
+    assert funcs["status"] == "Failed"
+
+
+def test_files_and_functions_many(helper):
+    paths = [_write(helper, i)["path"] for i in range(3)]
+    requested = [paths[2], "missing.py", paths[0]]
+
+    files = helper.get_files_many(OWNER, REPO, BRANCH, requested)["files"]
+    assert list(files) == requested
+    assert files[paths[2]]["path"] == paths[2]
+    assert files["missing.py"]["status"] == "Failed"
+
+    funcs = helper.get_functions_many(OWNER, REPO, BRANCH, requested)["functions"]
+    assert _names(funcs[paths[0]]) == ["func_0_0", "func_0_1", "func_0_2"]
+    assert funcs["missing.py"]["status"] == "Failed"
+
+
+def test_search_functions(helper):
+    _write(helper, 1)
+    _write(helper, 12)
+    exact = helper.search_functions(OWNER, REPO, BRANCH, "func_1_0", match="exact")[
+        "functions"
+    ]
+    assert _names(exact) == ["func_1_0"]
+    prefix = helper.search_functions(OWNER, REPO, BRANCH, "func_1", match="prefix")[
+        "functions"
+    ]
+    assert sorted(_names(prefix)) == [
+        "func_12_0",
+        "func_12_1",
+        "func_12_2",
+        "func_1_0",
+        "func_1_1",
+        "func_1_2",
+    ]
+
+
+def test_conditional_reads_see_lock_and_score_changes(helper):
+    path = _write(helper, 1)["path"]
+    assert (
+        helper.get_file(OWNER, REPO, BRANCH, path, known_commit="old")["file_lock"]
+        is False
+    )
+    helper.update_lock(OWNER, REPO, BRANCH, path, True)
+    assert (
+        helper.get_file(OWNER, REPO, BRANCH, path, known_commit="old")["file_lock"]
+        is True
+    )
+
+    helper.get_functions(OWNER, REPO, BRANCH, path, known_commit="old")
+    helper.update_user_score(OWNER, REPO, BRANCH, path, "func_1_0", 3)
+    funcs = helper.get_functions(OWNER, REPO, BRANCH, path, known_commit="old")
+    assert funcs["functions"][0]["user_score"] == 3
+
+
+def test_delete_file_returns_scores_and_removes_functions(helper):
+    path = _write(helper, 1)["path"]
+    helper.update_user_score(OWNER, REPO, BRANCH, path, "func_1_1", 4)
+    assert helper.delete_file(OWNER, REPO, BRANCH, path) == dict(
+        [("func_1_0", 0), ("func_1_1", 4), ("func_1_2", 0)]
+    )
+    assert helper.get_file(OWNER, REPO, BRANCH, path)["status"] == "Failed"
+    assert (
+        helper.search_functions(OWNER, REPO, BRANCH, "func_1_", match="prefix")[
+            "functions"
+        ]
+        == []
+    )
+
+
+def test_users(helper):
+    helper.create_user("first", "last", "user", "secret", "a@b.c", [])
+    assert (
+        helper.create_user("first", "last", "user", "secret", "a@b.c", [])["status"]
+        == "Failed"
+    )
+    assert helper.verify_user_login("secret", "user") is True
+    assert helper.verify_user_login("wrong", "user") is False
+
+
+def test_replace_keeps_natural_order():
+    col = MemoryDatabase()["test"]
+    ids = col.insert_many([dict([("n", n)]) for n in range(3)]).inserted_ids
+    col.update_one(dict([("_id", ids[0])]), {"$set": dict([("n", 10)])})
+    col.replace_one(dict([("_id", ids[1])]), dict([("n", 11)]))
+    assert [doc["n"] for doc in col.find()] == [10, 11, 2]
+
+
+def test_delete_repo_removes_files_in_batches(helper, monkeypatch):
+    monkeypatch.setattr("mongo_helper.DELETE_BATCH_SIZE", 2)
+    for i in range(5):
+        _write(helper, i)
+    assert helper.delete_repo(OWNER, REPO, BRANCH)["status"] == "Success"
+    assert helper.get_repo(OWNER, REPO, BRANCH)["status"] == "Failed"
+    assert helper.db[FILE_COL].find_one({}) is None
+    assert helper.db[FUNC_COL].find_one({}) is None
+
+
+def test_search_is_scoped_to_the_repo(helper):
+    _write(helper, 1)
+    helper.write_repo(OWNER, REPO, "other")
+    helper.write_file(make_file(1, 3, 5), OWNER, REPO, "other")
+    for branch in (BRANCH, "other"):
+        found = helper.search_functions(OWNER, REPO, branch, "func_1_", match="prefix")
+        assert len(found["functions"]) == 3
+        repo_id = helper.get_repo_id(OWNER, REPO, branch)["repo_id"]
+        assert all(f["repo_id"] == repo_id for f in found["functions"])
+
+
+def test_backfill_function_repo_ids(helper):
+    path = _write(helper, 1)["path"]
+    # functions written before repo_id was stored on them
+    helper.db[FUNC_COL].update_many({}, {"$unset": dict([("repo_id", "")])})
+    assert (
+        helper.search_functions(OWNER, REPO, BRANCH, "func_1_0", match="exact")[
+            "functions"
+        ]
+        == []
+    )
+
+    assert helper.backfill_function_repo_ids() == 3
+    assert helper.backfill_function_repo_ids() == 0
+    found = helper.search_functions(OWNER, REPO, BRANCH, "func_1_0", match="exact")
+    assert _names(found["functions"]) == ["func_1_0"]
+    assert len(helper.get_functions(OWNER, REPO, BRANCH, path)["functions"]) == 3
@@ -0,0 +1,159 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.synthetic import make_file
+from mongo_helper import MongoHelper
+from mongo_memory import MemoryCollection, MemoryDatabase
+from mongo_metrics import COMMAND_LISTENER, Metrics, instrument_methods
+from tests.conftest import BRANCH, OWNER, REPO
+
+
+# Sends the events the driver would for one find command that returns docs
+def _find_events(docs: list) -> None:
+    command = dict([("find", "file"), ("filter", {})])
+    COMMAND_LISTENER.started(SimpleNamespace(command=command, command_name="find"))
+    reply = dict([("cursor", dict([("firstBatch", docs)])), ("ok", 1)])
+    COMMAND_LISTENER.succeeded(SimpleNamespace(reply=reply, command_name="find"))
+
+
+@instrument_methods
+class Calls:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def read(self, docs: int) -> list:
+        _find_events([dict([("n", n)]) for n in range(docs)])
+        return []
+
+    def outer(self) -> list:
+        self.read(2)
+        return self.read(3)
+
+    def write(self, n: int) -> dict:
+        command = dict([("insert", "file")])
+        COMMAND_LISTENER.started(
+            SimpleNamespace(command=command, command_name="insert")
+        )
+        COMMAND_LISTENER.succeeded(
+            SimpleNamespace(reply=dict([("n", n), ("ok", 1)]), command_name="insert")
+        )
+        return {"status": "Success"}
+
+    def fail(self) -> dict:
+        return {"status": "Failed", "reason": "no"}
+
+    def boom(self) -> None:
+        raise ValueError("boom")
+
+    @staticmethod
+    def static() -> int:
+        return 1
+
+
+def test_calls_failures_and_errors():
+    metrics = Metrics()
+    calls = Calls(metrics)
+    calls.fail()
+    calls.fail()
+    with pytest.raises(ValueError):
+        calls.boom()
+    stats = metrics.snapshot()
+    assert (stats["fail"]["calls"], stats["fail"]["failures"]) == (2, 2)
+    assert (stats["boom"]["calls"], stats["boom"]["errors"]) == (1, 1)
+    assert stats["boom"]["failures"] == 0
+    assert Calls.static() == 1 and "static" not in stats
+
+
+def test_nested_calls_are_charged_to_the_outer_call():
+    metrics = Metrics()
+    Calls(metrics).outer()
+    stats = metrics.snapshot()
+    assert list(stats) == ["outer"]
+    assert (stats["outer"]["round_trips"], stats["outer"]["docs_read"]) == (2, 5)
+
+
+def test_commands_are_charged_to_the_calling_method():
+    metrics = Metrics()
+    calls = Calls(metrics)
+    calls.read(4)
+    calls.write(3)
+    stats = metrics.snapshot()
+    assert (stats["read"]["round_trips"], stats["read"]["docs_read"]) == (1, 4)
+    assert (stats["write"]["round_trips"], stats["write"]["docs_written"]) == (1, 3)
+    assert stats["read"]["bytes_read"] == 0
+
+    # commands outside an instrumented call are not charged to anything
+    _find_events([{}])
+    assert metrics.snapshot() == stats
+
+
+def test_bytes_are_measured_on_request():
+    metrics = Metrics(measure_bytes=True)
+    Calls(metrics).read(2)
+    stats = metrics.snapshot()["read"]
+    assert stats["bytes_read"] > 0 and stats["bytes_written"] > 0
+    assert "bytes_read_total" in metrics.to_prometheus()
+    assert "bytes_read_total" not in Metrics().to_prometheus()
+
+
+def test_hooks():
+    metrics = Metrics()
+    seen = []
+    metrics.add_hook(
+        lambda method, seconds, failed, error: seen.append(
+            (method, failed, type(error))
+        )
+    )
+    calls = Calls(metrics)
+    calls.fail()
+    with pytest.raises(ValueError):
+        calls.boom()
+    assert seen == [("fail", True, type(None)), ("boom", False, ValueError)]
+
+
+def test_prometheus_histogram():
+    metrics = Metrics(buckets=(0.001, 1.0))
+    for seconds in (0.0009765625, 0.5, 2.0):
+        metrics.record_call("get_file", seconds, False)
+    metrics.record_call("get_file", 0.5, True)
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert 'mongo_helper_call_seconds_bucket{method="get_file",le="0.001"} 1' in lines
+    assert 'mongo_helper_call_seconds_bucket{method="get_file",le="1.0"} 3' in lines
+    assert 'mongo_helper_call_seconds_bucket{method="get_file",le="+Inf"} 4' in lines
+    assert 'mongo_helper_call_seconds_sum{method="get_file"} 3.0009765625' in lines
+    assert 'mongo_helper_call_seconds_count{method="get_file"} 4' in lines
+    assert 'mongo_helper_failures_total{method="get_file"} 1' in lines
+    assert text.endswith("\n")
+
+    metrics.reset()
+    assert metrics.snapshot() == dict()
+
+
+def test_helper_on_memory_database(monkeypatch):
+    # the memory engine sends no driver events, so every find_one reports one as the driver would
+    find_one = MemoryCollection.find_one
+
+    def reporting_find_one(self, *args, **kwargs):
+        doc = find_one(self, *args, **kwargs)
+        _find_events([] if doc is None else [dict([("_id", 1)])])
+        return doc
+
+    monkeypatch.setattr(MemoryCollection, "find_one", reporting_find_one)
+    metrics = Metrics()
+    helper = MongoHelper(db=MemoryDatabase(), metrics=metrics)
+    helper.create_indexes()
+    helper.write_repo(OWNER, REPO, BRANCH)
+    helper.write_file(make_file(1, 2, 2), OWNER, REPO, BRANCH)
+    helper.get_file(OWNER, REPO, BRANCH, "missing.py")
+
+    stats = metrics.snapshot()
+    # get_repo_id and friends run inside these calls and are not counted on their own
+    assert set(stats) == {"create_indexes", "write_repo", "write_file", "get_file"}
+    assert stats["get_file"]["failures"] == 1
+    assert stats["write_file"]["failures"] == 0
+    # repo lookup and file probe in write_file, repo lookup and file read in get_file
+    assert stats["write_file"]["round_trips"] == 2
+    assert stats["get_file"]["round_trips"] == 2
+    assert stats["get_file"]["docs_read"] == 1
@@ -0,0 +1,55 @@
+import copy
+import pickle
+
+import pytest
+
+from benchmarks.synthetic import file_path, make_file
+from mongo_records import FunctionTable, Miss
+from tests.conftest import BRANCH, OWNER, REPO
+
+
+@pytest.fixture
+def table():
+    return FunctionTable(
+        [
+            dict([("name", "a"), ("start_line", 1)]),
+            dict([("name", "b"), ("doc", None)]),
+        ]
+    )
+
+
+def test_function_table_fields(table):
+    assert len(table) == 2
+    assert table[0].name == "a"
+    assert table[-1]["doc"] is None
+    assert table.column("start_line") == [1, None]
+    with pytest.raises(AttributeError):
+        table[1].start_line
+    with pytest.raises(KeyError):
+        table[0]["doc"]
+    assert table[1].to_dict() == dict([("name", "b"), ("doc", None)])
+    assert not table.find("c")
+
+
+def test_function_record_copies(table):
+    record = table.find("a")
+    assert copy.copy(record).to_dict() == record.to_dict()
+    assert copy.deepcopy(record).to_dict() == record.to_dict()
+    assert pickle.loads(pickle.dumps(record)).to_dict() == record.to_dict()
+
+
+def test_helper_records(helper):
+    helper.write_file(make_file(1, 3, 5), OWNER, REPO, BRANCH)
+    path = file_path(1)
+
+    assert helper.repo_record(OWNER, REPO, BRANCH).branch == BRANCH
+    missing = helper.repo_record(OWNER, REPO, "other")
+    assert isinstance(missing, Miss) and not missing
+
+    file = helper.file_record(OWNER, REPO, BRANCH, path, history=False)
+    assert (file.path, file.commits, file.line_history) == (path, 1, None)
+    functions = helper.function_table(OWNER, REPO, BRANCH, path)
+    assert [f.name for f in functions] == ["func_1_0", "func_1_1", "func_1_2"]
+    assert (
+        helper.function_record(OWNER, REPO, BRANCH, path, "func_1_1").start_line == 21
+    )
@@ -0,0 +1,79 @@
+"""Round trip budgets for the hot paths, so a change that adds queries to them fails here"""
+
+import pytest
+
+from benchmarks.synthetic import commit_sha, file_path, make_file
+from mongo_profiler import RoundTripBudgetExceeded, profile_queries
+from tests.conftest import BRANCH, OWNER, REPO
+
+PATH = file_path(1)
+
+
+@pytest.fixture
+def written(helper):
+    helper.write_file(make_file(1, 5, 10), OWNER, REPO, BRANCH)
+    return helper
+
+
+def test_write_file_update(written):
+    # repo, file probe, old scores, delete and insert functions, file update, repo touch
+    with profile_queries(written, budget=7) as profile:
+        result = written.write_file(make_file(1, 5, 10, commits=2), OWNER, REPO, BRANCH)
+    assert result["status"] == "Success"
+    assert profile.repeated() == []
+
+
+def test_write_file_unchanged(written):
+    with profile_queries(written, budget=2):
+        written.write_file(make_file(1, 5, 10), OWNER, REPO, BRANCH)
+
+
+def test_get_functions(written):
+    with profile_queries(written, budget=3) as profile:
+        funcs = written.get_functions(OWNER, REPO, BRANCH, PATH)
+    assert len(funcs["functions"]) == 5
+    assert profile.repeated() == [] and profile.loops() == []
+
+
+def test_get_functions_conditional(written):
+    with profile_queries(written, budget=2):
+        result = written.get_functions(
+            OWNER, REPO, BRANCH, PATH, known_commit=commit_sha("1-1")
+        )
+    assert result["status"] == "Not Modified"
+    with profile_queries(written, budget=3) as profile:
+        written.get_functions(OWNER, REPO, BRANCH, PATH, known_commit="old")
+    assert profile.repeated() == []
+
+
+def test_get_file(written):
+    with profile_queries(written, budget=2):
+        written.get_file(OWNER, REPO, BRANCH, PATH)
+    with profile_queries(written, budget=3) as profile:
+        doc = written.get_file(OWNER, REPO, BRANCH, PATH, known_commit="old")
+    assert doc["path"] == PATH
+    assert profile.repeated() == []
+
+
+def test_many_reads_do_not_loop_per_path(helper):
+    paths = []
+    for i in range(5):
+        helper.write_file(make_file(i, 2, 2), OWNER, REPO, BRANCH)
+        paths.append(file_path(i))
+    with profile_queries(helper, budget=2):
+        helper.get_files_many(OWNER, REPO, BRANCH, paths)
+    with profile_queries(helper, budget=3):
+        helper.get_functions_many(OWNER, REPO, BRANCH, paths)
+
+
+def test_budget_is_enforced(written):
+    with pytest.raises(RoundTripBudgetExceeded):
+        with profile_queries(written, budget=1):
+            written.get_functions(OWNER, REPO, BRANCH, PATH)
+
+
+@pytest.mark.parametrize("match", ["exact", "prefix", "text"])
+def test_search_functions_does_not_read_the_files(written, match):
+    # repo lookup and the search itself, however many files the repo has
+    with profile_queries(written, budget=2):
+        written.search_functions(OWNER, REPO, BRANCH, "func_1_0", match=match)